@@ -0,0 +1,21 @@
+import re
+from typing import Dict
+
+def keyword_pattern(keywords) -> str:
+    """Build a trie-shaped regex alternation so keywords sharing a prefix are matched once"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[''] = {}  # end of keyword
+    return _trie_pattern(trie)
+
+def _trie_pattern(node: Dict) -> str:
+    alternatives = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1 and '' not in node:
+        return alternatives[0]
+    pattern = '(?:' + '|'.join(alternatives) + ')'
+    return pattern + '?' if '' in node else pattern
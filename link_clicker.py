@@ -1,58 +1,86 @@
 import asyncio
+import atexit
+import csv
 import random
+import re
 import argparse
 from datetime import datetime
-from typing import List, Set
+from typing import List, Optional, Set
 from urllib.parse import urlparse
-import pandas as pd
-from playwright.async_api import async_playwright, Page, Response
+from playwright.async_api import async_playwright, Page, Response, Route
+from keyword_patterns import keyword_pattern
+
+VISITED_LOG = 'visited_domains.csv'
 
 class LinkInteractor:
     def __init__(self, max_concurrent: int = 3):
         self.max_concurrent = max_concurrent
-        self.visited_domains = pd.DataFrame(columns=['domain', 'timestamp', 'status', 'visited_at'])
+        self._visited: Set[str] = set()
         self._load_visited_domains()
 
+        # Append-only log: one row per visit instead of rewriting the whole file.
+        # Rows are buffered and flushed at the end of run() or on exit.
+        self._log_fh = open(VISITED_LOG, 'a', buffering=8192, newline='')
+        atexit.register(self._log_fh.close)
+        self._writer = csv.writer(self._log_fh)
+        if self._log_fh.tell() == 0:
+            self._writer.writerow(['domain', 'timestamp', 'status', 'visited_at'])
+
     def _load_visited_domains(self):
         try:
-            self.visited_domains = pd.read_csv('visited_domains.csv')
+            with open(VISITED_LOG, newline='') as f:
+                reader = csv.reader(f)
+                next(reader, None)  # skip header
+                self._visited = {row[0] for row in reader if row}
         except FileNotFoundError:
             pass
 
-    def _save_visited_domains(self):
-        self.visited_domains.to_csv('visited_domains.csv', index=False)
+    def _record_visit(self, domain: str, timestamp: str, status: str, visited_at: str):
+        self._writer.writerow([domain, timestamp, status, visited_at])
+        self._visited.add(domain)
 
     @staticmethod
     def get_domain(url: str) -> str:
         return urlparse(url).netloc.lower()
 
-    @staticmethod
-    def should_skip_url(url: str) -> bool:
-        skip_extensions = ('.png', '.jpg', '.gif', '.ico', '.svg', '.css', '.js')
-        skip_keywords = (
-            'unsubscribe', 'track.', 'email.', 'click.', 'links.', 
-            'notification.', 'redirect.', 'mail.', 'news.', 'link.',
-            'analytics.', 'pixel.', 'beacon.', 'open.', 'image.'
-        )
-        
-        parsed = urlparse(url.lower())
-        path_lower = parsed.path.lower()
-        
-        return (
-            url.endswith(skip_extensions) or
-            any(kw in parsed.netloc for kw in skip_keywords) or
-            'unsub' in path_lower or
-            'track' in path_lower or
-            'proc.php' in path_lower or
-            'click' in path_lower or
-            'open' in path_lower or
-            'pixel' in path_lower or
-            'beacon' in path_lower or
-            '/e/' in path_lower or
-            '/o/' in path_lower or
-            'ls/click' in path_lower
+    SKIP_EXTENSIONS = ('.png', '.jpg', '.gif', '.ico', '.svg', '.css', '.js')
+    SKIP_HOST_KEYWORDS = (
+        'unsubscribe', 'track.', 'email.', 'click.', 'links.', 
+        'notification.', 'redirect.', 'mail.', 'news.', 'link.',
+        'analytics.', 'pixel.', 'beacon.', 'open.', 'image.'
+    )
+    SKIP_PATH_KEYWORDS = (
+        'unsub', 'track', 'proc.php', 'click', 'open', 'pixel',
+        'beacon', '/e/', '/o/', 'ls/click'
+    )
+
+    BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font', 'stylesheet'})
+
+    # Split the URL once, then match each keyword list only against its own slice
+    _URL_PARTS_RE = re.compile(r'[^:/?#]*://(?P<netloc>[^/?#]*)(?P<path>[^?#]*)')
+    _SKIP_HOST_RE = re.compile(keyword_pattern(SKIP_HOST_KEYWORDS), re.IGNORECASE)
+    _SKIP_PATH_RE = re.compile(keyword_pattern(SKIP_PATH_KEYWORDS), re.IGNORECASE)
+
+    @classmethod
+    def should_skip_url(cls, url: str) -> bool:
+        if url.lower().endswith(cls.SKIP_EXTENSIONS):
+            return True
+        parts = cls._URL_PARTS_RE.match(url)
+        if not parts:
+            return False
+        return bool(
+            cls._SKIP_HOST_RE.search(parts.group('netloc')) or
+            cls._SKIP_PATH_RE.search(parts.group('path'))
         )
 
+    @classmethod
+    async def _route_request(cls, route: Route):
+        # Only the visit itself matters, so skip heavy assets entirely
+        if route.request.resource_type in cls.BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
     @staticmethod
     async def _setup_page(page: Page):
         await page.set_viewport_size({"width": 1366, "height": 768})
@@ -63,22 +91,23 @@ class LinkInteractor:
             "DNT": "1"
         })
 
-    async def visit_url(self, url: str, timestamp: str, page: Page) -> None:
-        domain = self.get_domain(url)
+    async def visit_url(self, url: str, timestamp: str, page: Page, domain: Optional[str] = None) -> None:
+        # Callers that already parsed the URL pass its domain to skip a second urlparse
+        if domain is None:
+            domain = self.get_domain(url)
         visited_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
         if self.should_skip_url(url):
             print(f"Skipping URL: {url}")
-            self.visited_domains.loc[len(self.visited_domains)] = [domain, timestamp, 'skipped', visited_at]
-            self._save_visited_domains()
+            self._record_visit(domain, timestamp, 'skipped', visited_at)
             return
 
-        if domain in self.visited_domains['domain'].values:
+        if domain in self._visited:
             print(f"Skipping domain: {domain}")
             return
 
         try:
-            response = await page.goto(url, timeout=15000)
+            response = await page.goto(url, timeout=15000, wait_until="domcontentloaded")
             if not response:
                 raise Exception("No response received")
             if not response.ok:
@@ -91,58 +120,67 @@ class LinkInteractor:
             
             await asyncio.sleep(random.uniform(1, 2))
             
-            self.visited_domains.loc[len(self.visited_domains)] = [domain, timestamp, 'successful', visited_at]
-            self._save_visited_domains()
+            self._record_visit(domain, timestamp, 'successful', visited_at)
             print(f"Successfully visited {url} [HTTP {response.status}]")
 
         except Exception as e:
             print(f"Error visiting {url}: {str(e)}")
-            self.visited_domains.loc[len(self.visited_domains)] = [domain, timestamp, 'failed', visited_at]
-            self._save_visited_domains()
+            self._record_visit(domain, timestamp, 'failed', visited_at)
 
     async def run(self, csv_path: str) -> None:
-        df = pd.read_csv(csv_path)
         urls_data = []
-        domains_seen = set()
-
-        for _, row in df.iterrows():
-            if pd.isna(row['Latest URLs']):
-                continue
-            
-            for url in row['Latest URLs'].split(';'):
-                url = url.strip()
-                if url.startswith('http'):
-                    domain = self.get_domain(url)
-                    if domain not in domains_seen and domain not in self.visited_domains['domain'].values:
-                        domains_seen.add(domain)
-                        urls_data.append((url, row['Latest Timestamp']))
+        session_seen: Set[str] = set()
+
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                latest_urls = row.get('Latest URLs')
+                if not latest_urls:
+                    continue
+                timestamp = row['Latest Timestamp']
+
+                for url in latest_urls.split(';'):
+                    url = url.strip()
+                    if url.startswith('http'):
+                        domain = self.get_domain(url)
+                        if domain in self._visited or domain in session_seen:
+                            continue
+                        session_seen.add(domain)
+                        urls_data.append((url, timestamp, domain))
 
         print(f"Found {len(urls_data)} unique domains to process")
 
         async with async_playwright() as p:
             browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
+            context = await browser.new_context(
+                java_script_enabled=True,
+                service_workers="block",
+                bypass_csp=True,
+                reduced_motion="reduce"
+            )
+            await context.route("**/*", self._route_request)
             
-            pages = []
+            # Workers pull the next URL as soon as their page is free, so one
+            # slow site no longer holds up the rest of a batch
+            queue = asyncio.Queue()
+            for item in urls_data:
+                queue.put_nowait(item)
             for _ in range(self.max_concurrent):
+                queue.put_nowait(None)
+
+            async def worker():
                 page = await context.new_page()
                 await self._setup_page(page)
-                pages.append(page)
+                try:
+                    while (item := await queue.get()) is not None:
+                        url, timestamp, domain = item
+                        await self.visit_url(url, timestamp, page, domain)
+                finally:
+                    await page.close()
 
             try:
-                batch_size = self.max_concurrent
-                for i in range(0, len(urls_data), batch_size):
-                    batch = urls_data[i:i + batch_size]
-                    tasks = [self.visit_url(url, timestamp, pages[j % len(pages)]) 
-                            for j, (url, timestamp) in enumerate(batch)]
-                    await asyncio.gather(*tasks)
-                    
-                    if i + batch_size < len(urls_data):
-                        delay = random.uniform(1, 3)
-                        print(f"Waiting {delay:.1f}s before next batch...")
-                        await asyncio.sleep(delay)
-                        
+                await asyncio.gather(*(worker() for _ in range(self.max_concurrent)))
             finally:
+                self._log_fh.flush()
                 await browser.close()
 
 async def main():
@@ -1,113 +1,150 @@
 import imaplib
 import email
 import re
+import sys
 import csv
 import argparse
+import multiprocessing
+import threading
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from urllib.parse import parse_qs, urlparse
+from itertools import chain
+from urllib.parse import unquote_plus
 from email.utils import parseaddr
-from typing import Dict, Set, List, Tuple
+from typing import Dict, Set, List, Tuple, Optional
+from keyword_patterns import keyword_pattern
+
+@dataclass(slots=True)
+class DomainStats:
+    """Latest tracking data seen for a single domain"""
+    latest_urls: Set[str] = field(default_factory=set)  # Only most recent URLs
+    latest_tracking_params: Dict[str, Set[str]] = field(default_factory=dict)
+    latest_click_ids: Set[str] = field(default_factory=set)
+    latest_source_email: str = ''
+    latest_timestamp: Optional[datetime] = None
+    latest_campaign_ids: Set[str] = field(default_factory=set)
 
 class EmailLinkExtractor:
+    FETCH_BATCH_SIZE = 200
+    FETCH_CONNECTIONS = 4
+
+    # Common tracking parameters
+    TRACKING_PATTERNS = {
+        'utm_': 'Google Analytics',
+        'fbclid': 'Facebook',
+        'gclid': 'Google Ads',
+        'mc_eid': 'Mailchimp',
+        'ml_subscriber': 'MailerLite',
+        'sb_': 'Sendgrid',
+        'ct0': 'Twitter',
+        'yclid': 'Yandex',
+        'msclkid': 'Microsoft',
+        '_hsenc': 'HubSpot',
+        'wickedid': 'WickedReports',
+        'ref': 'Referral',
+        'source': 'Source tracking',
+        'medium': 'Medium tracking',
+        'campaign': 'Campaign tracking',
+        'term': 'Keyword tracking',
+        'content': 'Content tracking',
+        'affiliate': 'Affiliate tracking',
+        'sid': 'Session ID',
+        'uid': 'User ID',
+        'cid': 'Campaign ID',
+        'lid': 'Link ID',
+        'pid': 'Product ID',
+        'rid': 'Referral ID',
+        'tid': 'Tracking ID',
+        'vid': 'Visitor ID',
+        'mid': 'Member ID',
+        'tag': 'Tag tracking',
+        'hsCtaTracking': 'HubSpot CTA',
+        'redirect': 'Redirect tracking'
+    }
+
+    PROMO_INDICATORS = (
+        'offer', 'deal', 'discount', 'save', 'sale', 'promo',
+        'buy', 'shop', 'order', 'purchase', 'subscribe',
+        'campaign', 'special', 'limited', 'exclusive', 'marketing',
+        'newsletter', 'unsubscribe', 'click', 'track', 'analytics',
+        'product', 'store', 'marketplace', 'cart', 'checkout',
+        'catalog', 'collection', 'brand', 'partner'
+    )
+
+    # The domain group comes out of the same scan as the URL itself
+    _URL_RE = re.compile(r'(?P<url>https?://(?P<domain>[^/?#\s<>"\']*)[^\s<>"\']*)')
+    # HTML parts: only anchor/link targets, not every URL-like run in CSS or scripts
+    _HREF_RE = re.compile(
+        r'href\s*=\s*["\']?(?P<url>https?://(?P<domain>[^/?#\s<>"\']*)[^\s<>"\']*)',
+        re.IGNORECASE
+    )
+    _UID_RE = re.compile(rb'UID (\d+)')
+    _HTML_AMP_RE = re.compile(r'&(?:amp|#38|#x26);', re.IGNORECASE)
+    _QUERY_PARAM_RE = re.compile(r'([^&=]+)=([^&]*)')
+    _TRACKING_PARAM_RE = re.compile(keyword_pattern(TRACKING_PATTERNS), re.IGNORECASE)
+    _CLICK_ID_RE = re.compile(r'(?:click[_-]?id|cid)$', re.IGNORECASE)
+    _PROMO_RE = re.compile(keyword_pattern(PROMO_INDICATORS))
+
     def __init__(self, email_address: str, password: str, imap_server: str = "imap.gmail.com"):
         self.email_address = email_address
         self.password = password
         self.imap_server = imap_server
         # Restructure to track by domain instead of email_id
-        self.domain_tracking = defaultdict(lambda: {
-            'latest_urls': set(),  # Only most recent URLs
-            'latest_tracking_params': defaultdict(set),
-            'latest_click_ids': set(),
-            'latest_source_email': '',
-            'latest_timestamp': None,
-            'latest_campaign_ids': set()
-        })
+        self.domain_tracking = defaultdict(DomainStats)
+        # Resolve the local timezone once rather than per tracked URL
+        self._local_tz = datetime.now().astimezone().tzinfo
         
+    def _open_connection(self) -> imaplib.IMAP4_SSL:
+        mail = imaplib.IMAP4_SSL(self.imap_server)
+        mail.login(self.email_address, self.password)
+        return mail
+
     def connect(self):
         try:
-            self.mail = imaplib.IMAP4_SSL(self.imap_server)
-            self.mail.login(self.email_address, self.password)
+            self.mail = self._open_connection()
             return True
         except Exception as e:
             print(f"Connection error: {str(e)}")
             return False
 
-    def extract_tracking_params(self, url: str) -> Dict[str, str]:
-        """Extract known tracking parameters from URLs"""
+    @classmethod
+    def extract_url_params(cls, url: str) -> Tuple[Dict[str, str], Set[str]]:
+        """Extract tracking parameters and click IDs in a single pass over the query"""
         tracking_params = {}
-        parsed = urlparse(url)
-        query_params = parse_qs(parsed.query)
-        
-        # Common tracking parameters
-        tracking_patterns = {
-            'utm_': 'Google Analytics',
-            'fbclid': 'Facebook',
-            'gclid': 'Google Ads',
-            'mc_eid': 'Mailchimp',
-            'ml_subscriber': 'MailerLite',
-            'sb_': 'Sendgrid',
-            'ct0': 'Twitter',
-            'yclid': 'Yandex',
-            'msclkid': 'Microsoft',
-            '_hsenc': 'HubSpot',
-            'wickedid': 'WickedReports',
-            'ref': 'Referral',
-            'source': 'Source tracking',
-            'medium': 'Medium tracking',
-            'campaign': 'Campaign tracking',
-            'term': 'Keyword tracking',
-            'content': 'Content tracking',
-            'affiliate': 'Affiliate tracking',
-            'sid': 'Session ID',
-            'uid': 'User ID',
-            'cid': 'Campaign ID',
-            'lid': 'Link ID',
-            'pid': 'Product ID',
-            'rid': 'Referral ID',
-            'tid': 'Tracking ID',
-            'vid': 'Visitor ID',
-            'mid': 'Member ID',
-            'tag': 'Tag tracking',
-            'hsCtaTracking': 'HubSpot CTA',
-            'redirect': 'Redirect tracking'
-        }
-
-        for param in query_params:
-            for pattern, tracker_type in tracking_patterns.items():
-                if pattern in param.lower():
-                    tracking_params[param] = query_params[param][0]
-                    
-        return tracking_params
+        click_ids = set()
+        query = url.partition('?')[2].partition('#')[0]
+
+        for param, value in cls._QUERY_PARAM_RE.findall(query):
+            if not value:
+                continue
+            if cls._CLICK_ID_RE.search(param):
+                click_ids.add(value)
+            if cls._TRACKING_PARAM_RE.search(param) and param not in tracking_params:
+                tracking_params[param] = unquote_plus(value)
+
+        return tracking_params, click_ids
 
-    def is_promotional_link(self, url: str, email_content: str) -> bool:
+    @classmethod
+    def extract_tracking_params(cls, url: str) -> Dict[str, str]:
+        """Extract known tracking parameters from URLs"""
+        return cls.extract_url_params(url)[0]
+
+    @classmethod
+    def is_promotional_link(cls, url: str, email_content: str = '', position: int = -1) -> bool:
         """Determine if a URL is likely a promotional or marketing link"""
-        promo_indicators = [
-            r'offer', r'deal', r'discount', r'save', r'sale', r'promo',
-            r'buy', r'shop', r'order', r'purchase', r'subscribe',
-            r'campaign', r'special', r'limited', r'exclusive', r'marketing',
-            r'newsletter', r'unsubscribe', r'click', r'track', r'analytics',
-            r'product', r'store', r'marketplace', r'cart', r'checkout',
-            r'catalog', r'collection', r'brand', r'partner'
-        ]
-        
-        url_lower = url.lower()
-        
-        # Check URL structure
-        if any(indicator in url_lower for indicator in promo_indicators):
+        # Check URL structure. Lowercasing first and matching case-sensitively is
+        # much faster than re.IGNORECASE, which defeats the literal-prefix scan
+        if cls._PROMO_RE.search(url.lower()):
             return True
-            
-        # Check surrounding content (simplified)
-        content_lower = email_content.lower()
-        url_index = content_lower.find(url_lower)
-        if url_index != -1:
-            # Check content around the URL
+
+        # Check content around the URL, located by the caller's match offset
+        if position != -1:
             window_size = 100
-            start = max(0, url_index - window_size)
-            end = min(len(content_lower), url_index + window_size)
-            surrounding_content = content_lower[start:end]
-            
-            if any(indicator in surrounding_content for indicator in promo_indicators):
+            start = max(0, position - window_size)
+            end = min(len(email_content), position + window_size)
+            if cls._PROMO_RE.search(email_content[start:end].lower()):
                 return True
                 
         return False
@@ -115,75 +152,109 @@ class EmailLinkExtractor:
     def update_domain_tracking(self, domain: str, url: str, tracking_params: Dict, 
                              timestamp: datetime, sender: str, click_ids: Set[str]):
         """Update domain tracking data if timestamp is more recent"""
+        # Parameter names and senders repeat across many domains; they are interned
+        # below, because strings unpickled from parse workers are always fresh copies.
+        # Domains are not: the dict key is their only long-lived copy already.
         current_data = self.domain_tracking[domain]
         
         # Ensure timestamps are timezone-aware
         if timestamp and timestamp.tzinfo is None:
-            timestamp = timestamp.replace(tzinfo=datetime.now().astimezone().tzinfo)
+            timestamp = timestamp.replace(tzinfo=self._local_tz)
             
-        if current_data['latest_timestamp'] and current_data['latest_timestamp'].tzinfo is None:
-            current_data['latest_timestamp'] = current_data['latest_timestamp'].replace(
-                tzinfo=datetime.now().astimezone().tzinfo
+        if current_data.latest_timestamp and current_data.latest_timestamp.tzinfo is None:
+            current_data.latest_timestamp = current_data.latest_timestamp.replace(
+                tzinfo=self._local_tz
             )
         
         # Update only if this is the first entry or if timestamp is more recent
-        if (current_data['latest_timestamp'] is None or 
-            timestamp > current_data['latest_timestamp']):
+        if (current_data.latest_timestamp is None or 
+            timestamp > current_data.latest_timestamp):
             
-            current_data['latest_urls'] = {url}  # Reset to only include latest URL
-            current_data['latest_tracking_params'] = defaultdict(set)
+            current_data.latest_urls = {url}  # Reset to only include latest URL
+            latest_params = current_data.latest_tracking_params
+            latest_params.clear()  # Reuse the dict rather than reallocating
             for param, value in tracking_params.items():
-                current_data['latest_tracking_params'][param].add(value)
-            current_data['latest_click_ids'] = click_ids
-            current_data['latest_source_email'] = sender
-            current_data['latest_timestamp'] = timestamp
+                latest_params.setdefault(sys.intern(param), set()).add(value)
+            current_data.latest_click_ids = click_ids
+            current_data.latest_source_email = sys.intern(sender)
+            current_data.latest_timestamp = timestamp
             
-        elif timestamp == current_data['latest_timestamp']:
+        elif timestamp == current_data.latest_timestamp:
             # If same timestamp, add to existing data
-            current_data['latest_urls'].add(url)
+            current_data.latest_urls.add(url)
+            latest_params = current_data.latest_tracking_params
             for param, value in tracking_params.items():
-                current_data['latest_tracking_params'][param].add(value)
-            current_data['latest_click_ids'].update(click_ids)
+                latest_params.setdefault(sys.intern(param), set()).add(value)
+            current_data.latest_click_ids.update(click_ids)
 
-    def extract_links_from_email(self, email_message):
-        """Extract and process links from email content"""
+    @classmethod
+    def parse_email_links(cls, email_message) -> List[Tuple]:
+        """Extract promotional links from an email as update_domain_tracking arguments"""
+        links = []
         try:
             timestamp = email.utils.parsedate_to_datetime(email_message['date'])
-            sender = email_message['from']
+            # Keep only the bare address in the long-lived tracking data
+            sender = parseaddr(email_message['from'] or '')[1]
 
             for part in email_message.walk():
                 if part.get_content_type() in ["text/plain", "text/html"]:
                     content = part.get_payload(decode=True)
                     if content:
+                        # Use the declared charset; errors='replace' keeps decoding exception-free
+                        charset = part.get_content_charset() or 'utf-8'
                         try:
-                            decoded_content = content.decode()
-                        except UnicodeDecodeError:
-                            decoded_content = content.decode('latin-1', errors='ignore')
+                            decoded_content = content.decode(charset, errors='replace')
+                        except (LookupError, UnicodeError):
+                            # Unknown charset, or a codec such as idna that rejects errors='replace'
+                            decoded_content = content.decode('utf-8', errors='replace')
 
                         # Extract URLs
-                        urls = re.findall(r'https?://[^\s<>"\']+', decoded_content)
-                        
-                        for url in urls:
-                            if self.is_promotional_link(url, decoded_content):
-                                domain = urlparse(url).netloc
-                                tracking_params = self.extract_tracking_params(url)
-                                
-                                # Extract click IDs
-                                click_patterns = [r'click[_-]?id=([^&]+)', r'cid=([^&]+)']
-                                click_ids = set()
-                                for pattern in click_patterns:
-                                    found_ids = re.findall(pattern, url)
-                                    click_ids.update(found_ids)
+                        is_html = part.get_content_type() == "text/html"
+                        url_re = cls._HREF_RE if is_html else cls._URL_RE
+                        seen_urls = set()
+                        for match in url_re.finditer(decoded_content):
+                            url = match.group('url')
+                            if url in seen_urls:
+                                continue
+                            seen_urls.add(url)
+
+                            if cls.is_promotional_link(url, decoded_content, match.start('url')):
+                                domain = match.group('domain')
+                                if is_html and '&' in url:
+                                    # Only undo escaped ampersands; a general entity
+                                    # decoder would also mangle params like &region=
+                                    url = cls._HTML_AMP_RE.sub('&', url)
+                                tracking_params, click_ids = cls.extract_url_params(url)
                                 
-                                self.update_domain_tracking(
+                                links.append((
                                     domain, url, tracking_params, 
                                     timestamp, sender, click_ids
-                                )
+                                ))
 
         except Exception as e:
             print(f"Error processing email: {str(e)}")
 
-    def scan_inbox(self, months_back: int = 6):
+        return links
+
+    def extract_links_from_email(self, email_message):
+        """Extract and process links from email content"""
+        for link in self.parse_email_links(email_message):
+            self.update_domain_tracking(*link)
+
+    @classmethod
+    def _message_label(cls, msg_data: List, i: int) -> str:
+        """Name a fetched message by UID; sequence numbers differ between connections"""
+        envelope = msg_data[i][0]
+        uid = cls._UID_RE.search(envelope)
+        # Servers may send the UID after the literal body, in the trailing b' UID n)'
+        if uid is None and i + 1 < len(msg_data) and isinstance(msg_data[i + 1], bytes):
+            uid = cls._UID_RE.search(msg_data[i + 1])
+        if uid is not None:
+            return f"UID {uid.group(1).decode()}"
+        return f"#{envelope.split()[0].decode()}"
+
+    def scan_inbox(self, months_back: int = 6, max_workers: Optional[int] = None,
+                   connections: int = FETCH_CONNECTIONS):
         """Scan inbox for tracking and promotional links"""
         if not hasattr(self, 'mail'):
             print("Not connected to email server")
@@ -191,35 +262,111 @@ class EmailLinkExtractor:
 
         date = (datetime.now() - timedelta(days=30 * months_back)).strftime("%d-%b-%Y")
         self.mail.select('inbox')
-        _, messages = self.mail.search(None, f'(SINCE {date})')
+        # UIDs stay valid across the extra fetch connections, sequence numbers may not
+        _, messages = self.mail.uid('search', None, f'(SINCE {date})')
         
         email_ids = messages[0].split()
         total_emails = len(email_ids)
         
         print(f"\nFound {total_emails} emails to scan from the past {months_back} months")
         
-        for index, email_id in enumerate(email_ids, 1):
-            try:
+        index = 0
+
+        def merge(futures):
+            # Tracking state lives in this process, so only the merge is serial
+            nonlocal index
+            for future in as_completed(futures):
+                index += 1
                 progress = (index / total_emails) * 100
                 print(f"\rProgress: {index}/{total_emails} emails scanned ({progress:.1f}%)", end="", flush=True)
-                
-                _, msg_data = self.mail.fetch(email_id, '(RFC822)')
-                email_body = msg_data[0][1]
-                email_message = email.message_from_bytes(email_body)
-                
-                self.extract_links_from_email(email_message)
-                
-            except Exception as e:
-                print(f"\nError processing message {email_id}: {str(e)}")
-                continue
+                try:
+                    for link in future.result():
+                        self.update_domain_tracking(*link)
+                except Exception as e:
+                    print(f"\nError processing message {futures[future]}: {str(e)}")
+
+        # Each fetch thread lazily opens its own connection, so several batches
+        # are in flight at once instead of waiting out one round-trip at a time
+        local = threading.local()
+        opened = []
+
+        def fetch_batch(batch):
+            mail = getattr(local, 'mail', None)
+            if mail is None:
+                mail = self._open_connection()
+                try:
+                    mail.select('inbox', readonly=True)
+                except Exception:
+                    _logout_quietly(mail)
+                    raise
+                # Only cache the connection once it is usable
+                local.mail = mail
+                opened.append(mail)
+            try:
+                # BODY.PEEK[] leaves messages unread
+                _, msg_data = mail.uid('fetch', b','.join(batch).decode(), '(BODY.PEEK[])')
+            except Exception:
+                # Drop the broken connection so this thread's next batch reconnects
+                local.mail = None
+                opened.remove(mail)
+                _logout_quietly(mail)
+                raise
+            return msg_data
+
+        batches = (email_ids[start:start + self.FETCH_BATCH_SIZE]
+                   for start in range(0, total_emails, self.FETCH_BATCH_SIZE))
+        fetching = {}
+
+        def fetch_next():
+            batch = next(batches, None)
+            if batch is not None:
+                fetching[fetcher.submit(fetch_batch, batch)] = batch
+
+        pending = {}
+        try:
+            # Spawn parse workers rather than forking them from a process that
+            # already has fetch threads mid-I/O, which can deadlock
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor, \
+                    ThreadPoolExecutor(max_workers=connections) as fetcher:
+                for _ in range(connections):
+                    fetch_next()
+
+                while fetching:
+                    done, _ = wait(fetching, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch = fetching.pop(future)
+                        try:
+                            msg_data = future.result()
+                        except Exception as e:
+                            print(f"\nError fetching messages UID {batch[0].decode()}-{batch[-1].decode()}: {str(e)}")
+                            index += len(batch)
+                            fetch_next()
+                            continue
+
+                        # Responses alternate (envelope, body) tuples with b')' terminators
+                        submitted = {
+                            executor.submit(_parse_bytes, item[1]): self._message_label(msg_data, i)
+                            for i, item in enumerate(msg_data) if isinstance(item, tuple)
+                        }
+                        # Merge the previous batch while workers parse this one
+                        merge(pending)
+                        pending = submitted
+                        # Only refill once merged, so fetched bodies can't pile up in memory
+                        fetch_next()
+
+                merge(pending)
+        finally:
+            for mail in opened:
+                _logout_quietly(mail)
 
     def save_to_csv(self):
         """Save latest tracking data per domain to CSV"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"latest_domain_tracking_{timestamp}.csv"
         
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
+        with open(filename, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
             writer.writerow([
                 'Domain',
                 'Latest Timestamp',
@@ -229,24 +376,24 @@ class EmailLinkExtractor:
                 'Latest Click IDs'
             ])
             
-            # Sort domains by timestamp for better readability
+            # Sort domains by timestamp for better readability; only save domains with data
             sorted_domains = sorted(
-                self.domain_tracking.items(),
-                key=lambda x: x[1]['latest_timestamp'] or datetime.min,
+                ((domain, data) for domain, data in self.domain_tracking.items() if data.latest_timestamp),
+                key=lambda x: x[1].latest_timestamp.timestamp(),
                 reverse=True
             )
             
             for domain, data in sorted_domains:
-                if data['latest_timestamp']:  # Only save domains with data
-                    writer.writerow([
-                        domain,
-                        data['latest_timestamp'].isoformat() if data['latest_timestamp'] else '',
-                        data['latest_source_email'],
-                        '; '.join(data['latest_urls']),
-                        '; '.join([f"{k}={v}" for k, params in data['latest_tracking_params'].items() 
-                                 for v in params]),
-                        '; '.join(data['latest_click_ids'])
-                    ])
+                writer.writerow([
+                    domain,
+                    data.latest_timestamp.isoformat(),
+                    data.latest_source_email,
+                    '; '.join(data.latest_urls),
+                    '; '.join(chain.from_iterable(
+                        (f"{k}={v}" for v in params) for k, params in data.latest_tracking_params.items()
+                    )),
+                    '; '.join(data.latest_click_ids)
+                ])
                     
         print(f"\nSaved latest tracking data per domain to: {filename}")
 
@@ -255,12 +402,26 @@ class EmailLinkExtractor:
             self.mail.close()
             self.mail.logout()
 
+def _logout_quietly(mail: imaplib.IMAP4):
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+def _parse_bytes(email_body: bytes) -> List[Tuple]:
+    """Worker entry point: parse a raw RFC822 message in a child process"""
+    return EmailLinkExtractor.parse_email_links(email.message_from_bytes(email_body))
+
 def main():
     parser = argparse.ArgumentParser(description='Email Marketing Link Extractor')
     parser.add_argument('-e', '--email', required=True, help='Email address')
     parser.add_argument('-p', '--password', required=True, help='Email password or app password')
     parser.add_argument('-m', '--months', type=int, default=6, help='Number of months to scan (default: 6)')
     parser.add_argument('-s', '--server', default='imap.gmail.com', help='IMAP server (default: imap.gmail.com)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                       help='Number of email parsing processes (default: CPU count)')
+    parser.add_argument('-c', '--connections', type=int, default=EmailLinkExtractor.FETCH_CONNECTIONS,
+                       help=f'Number of parallel IMAP fetch connections (default: {EmailLinkExtractor.FETCH_CONNECTIONS})')
     
     args = parser.parse_args()
     
@@ -268,7 +429,7 @@ def main():
     
     if extractor.connect():
         print(f"\nStarting email scan for marketing links...")
-        extractor.scan_inbox(months_back=args.months)
+        extractor.scan_inbox(months_back=args.months, max_workers=args.workers, connections=args.connections)
         extractor.save_to_csv()
         extractor.close()
         print("\nProcess finished!")